@@ -1,17 +1,63 @@
 import os
 import json
+import threading
 import google.generativeai as genai
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:  # optional, only makes serialization faster
+    orjson = None
+
 load_dotenv()
 
+# genai.configure sets process-wide state, so it only needs to run once
+_configure_lock = threading.Lock()
+_configured_key: Optional[str] = None
+
+def _configure_once(api_key: str):
+    global _configured_key
+    with _configure_lock:
+        if _configured_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
+
+# The model is constrained to answer with JSON matching these schemas,
+# so responses never need markdown or free-text cleanup
+_COMPLEXITY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "O": {"type": "STRING"},
+        "Omega": {"type": "STRING"},
+        "Theta": {"type": "STRING"},
+    },
+    "required": ["O", "Omega", "Theta"],
+}
+_COMPLEXITY_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=_COMPLEXITY_SCHEMA,
+)
+_COMPLEXITY_BATCH_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema={"type": "ARRAY", "items": _COMPLEXITY_SCHEMA},
+)
+
+def _compact_json(value: Any) -> str:
+    # No indentation: whitespace only adds prompt tokens
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
 class AIEngine:
+    # Verdicts are not cached here: the Analyzer memoizes them in the
+    # knowledge base, keyed like every other analysis result
+
     def __init__(self):
         # User should set this environment variable
         self.api_key = os.getenv("GEMINI_API_KEY")
         if self.api_key:
-            genai.configure(api_key=self.api_key)
+            _configure_once(self.api_key)
             self.model = genai.GenerativeModel('gemini-1.5-flash')
         else:
             print("Warning: GEMINI_API_KEY environment variable not set. AI features will return errors.")
@@ -33,7 +79,7 @@ class AIEngine:
         2. Non-linear updates.
         3. Recursive calls.
 
-        Return ONLY a raw JSON object (no markdown formatting, no explanations outside JSON) with the following keys:
+        Return a JSON object with the following keys:
         - "O": The Big O complexity (Worst Case).
         - "Omega": The Big Omega complexity (Best Case).
         - "Theta": The Big Theta complexity (Average Case).
@@ -41,28 +87,74 @@ class AIEngine:
         Use standard notation like "n^2", "n log n", "1", "n".
 
         AST:
-        {json.dumps(ast_subtree, indent=2)}
+        {_compact_json(ast_subtree)}
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
-            
-            # Clean up potential markdown code blocks if the model ignores instructions
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.startswith("```"):
-                text = text[3:]
-            if text.endswith("```"):
-                text = text[:-3]
-            
-            result = json.loads(text.strip())
+            result = self._generate_json(prompt, _COMPLEXITY_CONFIG)
             
             # Validate keys
-            if not all(k in result for k in ["O", "Omega", "Theta"]):
+            if not self._is_valid(result):
                 return {"O": "Error: Invalid AI Response", "Omega": "Error", "Theta": "Error"}
                 
             return result
             
         except Exception as e:
             return {"O": f"Error: {str(e)}", "Omega": "Error", "Theta": "Error"}
+
+    def analyze_complexity_batch(self, ast_subtrees: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Analyzes several AST subtrees with a single Gemini request.
+        Results are returned in the same order as the input subtrees.
+        """
+        if not ast_subtrees:
+            return []
+        if len(ast_subtrees) == 1:
+            return [self.analyze_complexity(ast_subtrees[0])]
+        if not self.api_key:
+             return [{"O": "Error: Missing API Key", "Omega": "Error", "Theta": "Error"} for _ in ast_subtrees]
+
+        prompt = f"""
+        You are an expert in Algorithmic Complexity Analysis.
+        Analyze the time complexity of each of the following Abstract Syntax Trees (ASTs) representing pseudocode algorithms.
+        The ASTs are provided as a JSON array.
+        
+        Focus on:
+        1. Dependent loops (inner loop limits depending on outer loop variables).
+        2. Non-linear updates.
+        3. Recursive calls.
+
+        Return a JSON array with exactly one object per AST, in the same order as the input.
+        Each object must have the following keys:
+        - "O": The Big O complexity (Worst Case).
+        - "Omega": The Big Omega complexity (Best Case).
+        - "Theta": The Big Theta complexity (Average Case).
+        
+        Use standard notation like "n^2", "n log n", "1", "n".
+
+        ASTs:
+        {_compact_json(ast_subtrees)}
+        """
+
+        try:
+            results = self._generate_json(prompt, _COMPLEXITY_BATCH_CONFIG)
+
+            if not isinstance(results, list) or len(results) != len(ast_subtrees):
+                return [{"O": "Error: Invalid AI Response", "Omega": "Error", "Theta": "Error"} for _ in ast_subtrees]
+
+            return [
+                r if self._is_valid(r) else {"O": "Error: Invalid AI Response", "Omega": "Error", "Theta": "Error"}
+                for r in results
+            ]
+
+        except Exception as e:
+            return [{"O": f"Error: {str(e)}", "Omega": "Error", "Theta": "Error"} for _ in ast_subtrees]
+
+    def _generate_json(self, prompt: str, generation_config: genai.GenerationConfig) -> Any:
+        response = self.model.generate_content(prompt, generation_config=generation_config)
+        return json.loads(response.text)
+
+    @staticmethod
+    def _is_valid(result: Any) -> bool:
+        # The terms must be strings: callers parse them and check for errors
+        return isinstance(result, dict) and all(isinstance(result.get(k), str) for k in ["O", "Omega", "Theta"])
@@ -1,170 +1,386 @@
-from typing import Dict, Any, List, Optional
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple, Union, TYPE_CHECKING
 from .models import *
 from .knowledge_base import KnowledgeBase
 import re
 
+if TYPE_CHECKING:
+    from .ai_engine import AIEngine
+
+# Terms like "n^2 log n": an optional power of n followed by an optional power of log n
+_TERM_RE = re.compile(r'^(?:n(?:\^(\d+))?)?\s*(?:log(?:\^(\d+))?\s*\(?n\)?)?$')
+
+@dataclass(frozen=True)
+class Term:
+    """
+    A single complexity term n^n_pow * log^log_pow n. Anything that does not
+    fit that shape (e.g. "2^n" or an AI error) is kept verbatim in raw.
+    """
+    __slots__ = ('n_pow', 'log_pow', 'raw')
+    n_pow: int
+    log_pow: int
+    raw: Optional[str]
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def parse(text: str) -> 'Term':
+        # Terms are immutable, so every occurrence of the same string can share one
+        text = text.strip()
+        if text == "1":
+            return Term(0, 0, None)
+        m = _TERM_RE.match(text)
+        if m and text:
+            n_pow = 0
+            if text.startswith("n"):
+                n_pow = int(m.group(1)) if m.group(1) else 1
+            log_pow = 0
+            if "log" in text:
+                log_pow = int(m.group(2)) if m.group(2) else 1
+            return Term(n_pow, log_pow, None)
+        return Term(0, 0, text)
+
+    def is_one(self) -> bool:
+        return self.raw is None and self.n_pow == 0 and self.log_pow == 0
+
+    def is_error(self) -> bool:
+        # AI errors stay verbatim in raw, also once combined (e.g. "n * Error: ...")
+        return self.raw is not None and "Error" in self.raw
+
+    def __add__(self, other: 'Term') -> 'Term':
+        # Addition keeps the dominant term
+        if self.is_one(): return other
+        if other.is_one(): return self
+        if self == other: return self
+        if self.raw is None and other.raw is None:
+            return max(self, other, key=lambda t: (t.n_pow, t.log_pow))
+        return Term(0, 0, f"max({self}, {other})")
+
+    def __mul__(self, other: 'Term') -> 'Term':
+        if self.is_one(): return other
+        if other.is_one(): return self
+        if self.raw is None and other.raw is None:
+            return Term(self.n_pow + other.n_pow, self.log_pow + other.log_pow, None)
+        return Term(0, 0, f"{self} * {other}")
+
+    def __str__(self):
+        if self.raw is not None:
+            return self.raw
+        parts = []
+        if self.n_pow:
+            parts.append("n" if self.n_pow == 1 else f"n^{self.n_pow}")
+        if self.log_pow:
+            parts.append("log n" if self.log_pow == 1 else f"log^{self.log_pow} n")
+        return " ".join(parts) or "1"
+
 class Complexity:
-    def __init__(self, o: str = "1", omega: str = "1", theta: str = "1"):
-        self.o = o
-        self.omega = omega
-        self.theta = theta
+    """
+    Immutable O/Omega/Theta triple. + and * may hand back one of their
+    operands (e.g. x * ONE is x), which is safe because no instance ever
+    changes; the same goes for the shared ONE and N constants below.
+    """
+    __slots__ = ('o', 'omega', 'theta')
+
+    def __init__(self, o: Union[str, Term] = "1", omega: Union[str, Term] = "1", theta: Union[str, Term] = "1"):
+        # Terms are parsed once here; arithmetic works on the parsed form
+        object.__setattr__(self, 'o', o if isinstance(o, Term) else Term.parse(o))
+        object.__setattr__(self, 'omega', omega if isinstance(omega, Term) else Term.parse(omega))
+        object.__setattr__(self, 'theta', theta if isinstance(theta, Term) else Term.parse(theta))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Complexity is immutable")
+
+    def __reduce__(self):
+        # Rebuilt from the rendered terms, since __setattr__ is blocked
+        return (Complexity, (str(self.o), str(self.omega), str(self.theta)))
+
+    def __eq__(self, other):
+        if not isinstance(other, Complexity):
+            return NotImplemented
+        return (self.o, self.omega, self.theta) == (other.o, other.omega, other.theta)
+
+    def __hash__(self):
+        return hash((self.o, self.omega, self.theta))
 
     def __repr__(self):
         return f"O({self.o}), Ω({self.omega}), Θ({self.theta})"
 
     def to_dict(self):
-        return {"O": self.o, "Omega": self.omega, "Theta": self.theta}
+        return {"O": str(self.o), "Omega": str(self.omega), "Theta": str(self.theta)}
 
     @staticmethod
     def from_dict(d: Dict[str, str]):
         return Complexity(d.get("O", "1"), d.get("Omega", "1"), d.get("Theta", "1"))
 
+    def is_error(self) -> bool:
+        return self.o.is_error() or self.omega.is_error() or self.theta.is_error()
+
     def __add__(self, other: 'Complexity') -> 'Complexity':
         # Simplistic addition: max of terms
-        return Complexity(
-            self._add_term(self.o, other.o),
-            self._add_term(self.omega, other.omega),
-            self._add_term(self.theta, other.theta)
-        )
+        if other is ONE: return self
+        if self is ONE: return other
+        return Complexity(self.o + other.o, self.omega + other.omega, self.theta + other.theta)
 
     def __mul__(self, other: 'Complexity') -> 'Complexity':
-        # Simplistic multiplication
-        return Complexity(
-            self._mul_term(self.o, other.o),
-            self._mul_term(self.omega, other.omega),
-            self._mul_term(self.theta, other.theta)
-        )
-
-    def _add_term(self, t1: str, t2: str) -> str:
-        if t1 == "1": return t2
-        if t2 == "1": return t1
-        if t1 == t2: return t1
-        # Very basic comparison logic (lexicographical is bad, but sufficient for simple cases)
-        # Better: parse "n", "n^2", "log n"
-        # For now, just return "max(" + t1 + ", " + t2 + ")" if unknown
-        # Or simple heuristic:
-        if "n^" in t1 and "n^" in t2:
-            p1 = int(t1.split("^")[1])
-            p2 = int(t2.split("^")[1])
-            return f"n^{max(p1, p2)}"
-        if "n" in t1 and t2 == "1": return t1
-        if "n" in t2 and t1 == "1": return t2
-        return f"max({t1}, {t2})"
-
-    def _mul_term(self, t1: str, t2: str) -> str:
-        if t1 == "1": return t2
-        if t2 == "1": return t1
-        # n * n = n^2
-        if t1 == "n" and t2 == "n": return "n^2"
-        if "n^" in t1 and t2 == "n":
-            p = int(t1.split("^")[1])
-            return f"n^{p+1}"
-        if t1 == "n" and "n^" in t2:
-            p = int(t2.split("^")[1])
-            return f"n^{p+1}"
-        return f"{t1} * {t2}"
+        if other is ONE: return self
+        if self is ONE: return other
+        return Complexity(self.o * other.o, self.omega * other.omega, self.theta * other.theta)
+
+# The two complexities the analyzer builds all the time
+ONE = Complexity("1", "1", "1")
+N = Complexity("n", "n", "n")
 
 class Analyzer:
-    def __init__(self, kb: KnowledgeBase):
+    def __init__(self, kb: KnowledgeBase, ai_engine: Optional['AIEngine'] = None):
         self.kb = kb
+        self._ai = ai_engine
+
+    @property
+    def ai(self) -> 'AIEngine':
+        # Created on first use so purely static analyses never touch the SDK
+        if self._ai is None:
+            from .ai_engine import AIEngine
+            self._ai = AIEngine()
+        return self._ai
 
     def analyze(self, node: ASTNode, context: Dict[str, Any] = None) -> Complexity:
         if context is None:
             context = {}
 
-        # 1. Check Memoization
-        signature = KnowledgeBase.compute_signature(node.to_dict())
-        cached = self.kb.get_complexity(signature)
-        if cached:
-            return Complexity.from_dict(cached)
-
-        # 2. Analyze based on type
-        result = Complexity("1", "1", "1")
-        
-        if isinstance(node, Program):
-            result = self.analyze(node.main_block, context)
-        
-        elif isinstance(node, Block):
-            total = Complexity("1", "1", "1")
-            for stmt in node.statements:
-                total = total + self.analyze(stmt, context)
-            result = total
-            
-        elif isinstance(node, Assignment):
-            result = Complexity("1", "1", "1") + self.analyze(node.value, context)
-            
-        elif isinstance(node, IfStatement):
-            cond_cost = self.analyze(node.condition, context)
-            then_cost = self.analyze(node.then_block, context)
-            else_cost = self.analyze(node.else_block, context) if node.else_block else Complexity("1", "1", "1")
-            max_branch = then_cost + else_cost 
-            result = cond_cost + max_branch
-            
-        elif isinstance(node, ForLoop):
-            # Check for dependency
-            is_dependent = self.check_dependency(node, context)
-            if is_dependent:
-                # Use AI for dependent loops
-                from .ai_engine import AIEngine
-                ai = AIEngine()
-                ai_result = ai.analyze_complexity(node.to_dict())
+        # Phase 1: collect the dependent loops that are not memoized yet
+        pending: Dict[str, List[Tuple[ForLoop, Dict[str, Any]]]] = {}
+        self._collect_dependent_loops(node, context, pending)
+
+        # Phase 2: resolve all of them with a single AI request
+        if pending:
+            loops = [occurrences[0][0].to_dict() for occurrences in pending.values()]
+            ai_results = self.ai.analyze_complexity_batch(loops)
+            for (key, occurrences), ai_result in zip(pending.items(), ai_results):
                 result = Complexity.from_dict(ai_result)
-            else:
-                # Independent
-                # Update context with loop variable?
-                new_context = context.copy()
-                new_context['loop_var'] = node.variable
-                
-                iterations = self.estimate_iterations(node.start_value, node.end_value)
-                body_cost = self.analyze(node.body, new_context)
-                result = iterations * body_cost
-            
-        elif isinstance(node, WhileLoop):
-            result = Complexity("n", "n", "n") * self.analyze(node.body, context)
-            
-        elif isinstance(node, RepeatLoop):
-            result = Complexity("n", "n", "n") * self.analyze(node.body, context)
-            
-        elif isinstance(node, Call):
-            result = Complexity("1", "1", "1")
-            
-        elif isinstance(node, Expression):
-            if isinstance(node, BinaryOp):
-                result = self.analyze(node.left, context) + self.analyze(node.right, context)
-            elif isinstance(node, UnaryOp):
-                result = self.analyze(node.operand, context)
-            elif isinstance(node, Literal) or isinstance(node, Variable):
-                result = Complexity("1", "1", "1")
-            elif isinstance(node, ArrayAccess):
-                result = self.analyze(node.index, context)
-            
-        # 3. Memoize
-        self.kb.add_complexity(signature, result.to_dict())
-        return result
+                if not result.is_error():
+                    self.kb.add_complexity(key, ai_result)
+                    continue
+                # Errors are not cached so they can be retried on the next run;
+                # for this run they go on the nodes so phase 3 doesn't ask again
+                for loop, loop_context in occurrences:
+                    loop._inline_ctx, loop._inline_res = loop_context.get('loop_vars'), result
+
+        # Phase 3: regular traversal, dependent loops now hit the memo
+        return self._analyze(node, context)
+
+    def _collect_dependent_loops(self, node: ASTNode, context: Dict[str, Any],
+                                 pending: Dict[str, List[Tuple[ForLoop, Dict[str, Any]]]]):
+        """
+        Walks the AST like _analyze does, but instead of calling the AI for
+        dependent ForLoops it queues them (with their context) in pending,
+        keyed like the knowledge base (see _memo_key).
+        """
+        stack = [(node, context)]
+        while stack:
+            node, context = stack.pop()
+            # Expressions never contain loops
+            if node is None or isinstance(node, Expression):
+                continue
+
+            if node._inline_res is not None and node._inline_ctx == context.get('loop_vars'):
+                continue
+            # Dependent loops are where _analyze stops descending and asks the AI.
+            # Their key always names the loop variables they depend on, so a
+            # verdict cached for an independent copy of the same loop never hides them
+            dependent = isinstance(node, ForLoop) and self.check_dependency(node, context)
+            key = self._memo_key(node, context)
+            if self.kb.get_complexity(key):
+                continue
+            if dependent:
+                pending.setdefault(key, []).append((node, context))
+                continue
+            handlers = Analyzer._DISPATCH.get(type(node), Analyzer._DEFAULT)
+            stack.extend(reversed(handlers[0](self, node, context)))
+
+    def _signature(self, node: ASTNode) -> str:
+        # Hash each subtree only once per process, the result lives on the node
+        if node._memo_sig is None:
+            node._memo_sig = KnowledgeBase.compute_node_signature(node)
+        return node._memo_sig
+
+    def _memo_key(self, node: ASTNode, context: Dict[str, Any]) -> str:
+        # The same subtree can be dependent in one place and independent in
+        # another, depending on which of its names are enclosing loop variables.
+        # Those names are added to the key by their index of first use, the
+        # same renaming the signature uses, so renamed copies still share it.
+        signature = self._signature(node)
+        loop_vars = context.get('loop_vars')
+        if loop_vars:
+            bound = [str(i) for i, name in enumerate(node._struct_names) if name in loop_vars]
+            if bound:
+                return f"{signature}:{','.join(bound)}"
+        return signature
+
+    def _analyze(self, root: ASTNode, context: Dict[str, Any]) -> Complexity:
+        # Post-order walk with an explicit stack instead of recursion.
+        # An entry is (node, context, children); children is None until the node
+        # is expanded, then it holds the (child, child_context) pairs to combine.
+        results: Dict[int, Complexity] = {}
+        stack: List[Tuple[ASTNode, Dict[str, Any], Optional[List[Tuple[ASTNode, Dict[str, Any]]]]]] = [
+            (root, context, None)
+        ]
+
+        while stack:
+            node, ctx, children = stack.pop()
+
+            if children is None:
+                # 1. Check Memoization
+                cached = self._lookup(node, ctx)
+                if cached is not None:
+                    results[id(node)] = cached
+                    continue
+
+                # 2. Expand: revisit the node once all its children are done
+                handlers = Analyzer._DISPATCH.get(type(node), Analyzer._DEFAULT)
+                children = handlers[0](self, node, ctx)
+                stack.append((node, ctx, children))
+                for child in reversed(children):
+                    stack.append((child[0], child[1], None))
+                continue
+
+            # 3. Combine the children costs and memoize
+            costs = [results.pop(id(child)) for child, _ in children]
+            handlers = Analyzer._DISPATCH.get(type(node), Analyzer._DEFAULT)
+            result = handlers[1](self, node, ctx, costs)
+            self._store(node, ctx, result)
+            results[id(node)] = result
+
+        return results[id(root)]
+
+    def _lookup(self, node: ASTNode, context: Dict[str, Any]) -> Optional[Complexity]:
+        # First the slot on the node itself, then the knowledge base.
+        # The enclosing loop variables are the only part of the context that affects the result.
+        ctx_key = context.get('loop_vars')
+        if node._inline_res is not None and node._inline_ctx == ctx_key:
+            return node._inline_res
+
+        cached = self.kb.get_complexity(self._memo_key(node, context))
+        if cached:
+            result = Complexity.from_dict(cached)
+            node._inline_ctx, node._inline_res = ctx_key, result
+            return result
+        return None
+
+    def _store(self, node: ASTNode, context: Dict[str, Any], result: Complexity):
+        # Results built on an AI error stay out of the knowledge base, like the error itself
+        if not result.is_error():
+            self.kb.add_complexity(self._memo_key(node, context), result.to_dict())
+        node._inline_ctx, node._inline_res = context.get('loop_vars'), result
+
+    # Each node type has a pair of handlers: one lists the children to analyze
+    # (with the context they run in), the other combines their costs.
+
+    def _children_program(self, node: Program, context: Dict[str, Any]):
+        return [(node.main_block, context)]
+
+    def _combine_program(self, node: Program, context: Dict[str, Any], costs: List[Complexity]) -> Complexity:
+        return costs[0]
+
+    def _children_block(self, node: Block, context: Dict[str, Any]):
+        return [(stmt, context) for stmt in node.statements]
+
+    def _combine_block(self, node: Block, context: Dict[str, Any], costs: List[Complexity]) -> Complexity:
+        total = ONE
+        for cost in costs:
+            total = total + cost
+        return total
+
+    def _children_assignment(self, node: Assignment, context: Dict[str, Any]):
+        return [(node.value, context)]
+
+    def _combine_assignment(self, node: Assignment, context: Dict[str, Any], costs: List[Complexity]) -> Complexity:
+        return ONE + costs[0]
+
+    def _children_if(self, node: IfStatement, context: Dict[str, Any]):
+        children = [(node.condition, context), (node.then_block, context)]
+        if node.else_block:
+            children.append((node.else_block, context))
+        return children
+
+    def _combine_if(self, node: IfStatement, context: Dict[str, Any], costs: List[Complexity]) -> Complexity:
+        cond_cost, then_cost = costs[0], costs[1]
+        else_cost = costs[2] if node.else_block else ONE
+        max_branch = then_cost + else_cost 
+        return cond_cost + max_branch
+
+    def _children_for(self, node: ForLoop, context: Dict[str, Any]):
+        # Dependent loops are analyzed as a whole by the AI, nothing to descend into
+        if self.check_dependency(node, context):
+            return []
+        # Independent: the body runs with this loop's variable in scope
+        new_context = context.copy()
+        new_context['loop_vars'] = context.get('loop_vars', frozenset()) | {node.variable}
+        return [(node.body, new_context)]
+
+    def _combine_for(self, node: ForLoop, context: Dict[str, Any], costs: List[Complexity]) -> Complexity:
+        if not costs:
+            # Use AI for dependent loops (normally already resolved by the batch in analyze)
+            ai_result = self.ai.analyze_complexity(node.to_dict())
+            return Complexity.from_dict(ai_result)
+
+        iterations = self.estimate_iterations(node.start_value, node.end_value)
+        return iterations * costs[0]
+
+    def _children_loop(self, node: ASTNode, context: Dict[str, Any]):
+        return [(node.body, context)]
+
+    def _combine_loop(self, node: ASTNode, context: Dict[str, Any], costs: List[Complexity]) -> Complexity:
+        # While and Repeat loops are assumed to run n times
+        return N * costs[0]
+
+    def _children_binary_op(self, node: BinaryOp, context: Dict[str, Any]):
+        return [(node.left, context), (node.right, context)]
+
+    def _combine_binary_op(self, node: BinaryOp, context: Dict[str, Any], costs: List[Complexity]) -> Complexity:
+        return costs[0] + costs[1]
+
+    def _children_unary_op(self, node: UnaryOp, context: Dict[str, Any]):
+        return [(node.operand, context)]
+
+    def _children_array_access(self, node: ArrayAccess, context: Dict[str, Any]):
+        return [(node.index, context)]
+
+    def _combine_passthrough(self, node: ASTNode, context: Dict[str, Any], costs: List[Complexity]) -> Complexity:
+        return costs[0]
+
+    def _children_none(self, node: ASTNode, context: Dict[str, Any]):
+        return []
+
+    def _combine_constant(self, node: ASTNode, context: Dict[str, Any], costs: List[Complexity]) -> Complexity:
+        # Calls, literals, variables and anything without a cost model of its own
+        return ONE
+
+    _DEFAULT = (_children_none, _combine_constant)
+
+    _DISPATCH = {
+        Program: (_children_program, _combine_program),
+        Block: (_children_block, _combine_block),
+        Assignment: (_children_assignment, _combine_assignment),
+        IfStatement: (_children_if, _combine_if),
+        ForLoop: (_children_for, _combine_for),
+        WhileLoop: (_children_loop, _combine_loop),
+        RepeatLoop: (_children_loop, _combine_loop),
+        BinaryOp: (_children_binary_op, _combine_binary_op),
+        UnaryOp: (_children_unary_op, _combine_passthrough),
+        ArrayAccess: (_children_array_access, _combine_passthrough),
+        Call: _DEFAULT,
+        Literal: _DEFAULT,
+        Variable: _DEFAULT,
+    }
 
     def check_dependency(self, node: ForLoop, context: Dict[str, Any]) -> bool:
-        # Check if start or end value depends on a variable in context (outer loop var)
-        # This is a simplified check.
-        # We need to traverse start_value and end_value to see if they contain variables present in context.
-        # For now, let's assume if 'i' is in context and node uses 'i', it's dependent.
-        # But we need to know what variables are from outer loops.
-        # Context should store outer loop variables.
-        
-        outer_vars = context.keys()
-        
-        def contains_var(expr: ASTNode, vars: List[str]) -> bool:
-            if isinstance(expr, Variable):
-                return expr.name in vars
-            if isinstance(expr, BinaryOp):
-                return contains_var(expr.left, vars) or contains_var(expr.right, vars)
-            return False
-
-        if contains_var(node.start_value, outer_vars) or contains_var(node.end_value, outer_vars):
-            return True
-            
-        return False
+        # A loop is dependent when either bound uses the variable of an enclosing loop.
+        # The variables used by each bound are computed once per expression
+        outer_vars = context.get('loop_vars', frozenset())
+        return (not free_vars(node.start_value).isdisjoint(outer_vars)
+                or not free_vars(node.end_value).isdisjoint(outer_vars))
 
     def estimate_iterations(self, start: Expression, end: Expression) -> Complexity:
         if isinstance(end, Variable) and end.name == 'n':
-            return Complexity("n", "n", "n")
-        return Complexity("n", "n", "n")
+            return N
+        return N
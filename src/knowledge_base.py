@@ -1,34 +1,141 @@
 import json
 import os
+import mmap
 import hashlib
-from typing import Dict, Optional
+import dataclasses
+from typing import Any, Dict, List, Optional, Tuple
+from .models import ASTNode
+
+try:
+    import orjson
+except ImportError:  # optional, only makes serialization faster
+    orjson = None
 
 class KnowledgeBase:
+    """
+    Memo of analysis results, persisted as append-only JSON lines: one
+    {"sig": ..., "O": ..., "Omega": ..., "Theta": ...} record per entry.
+    Later lines win, compact() drops the stale ones.
+    """
+
+    # Rewrite the file once it holds this many times more lines than live entries
+    COMPACT_RATIO = 2
+    COMPACT_MIN_LINES = 1000
+
     def __init__(self, filepath: str):
         self.filepath = filepath
-        self.data: Dict[str, Dict[str, str]] = {}
-        self.load()
+        # Loaded on first use (see data), so creating a KnowledgeBase costs nothing
+        self._data: Optional[Dict[str, Dict[str, str]]] = None
+        # Records not written yet; flush() appends them to the file
+        self._unsaved: List[Dict[str, str]] = []
+        self._lines_on_disk = 0
+        # Entries added since load, in the same layout as data (see take_changes)
+        self._changes: Dict[str, Dict[str, str]] = {}
+
+    @property
+    def data(self) -> Dict[str, Dict[str, str]]:
+        if self._data is None:
+            self.load()
+        return self._data
+
+    @data.setter
+    def data(self, value: Dict[str, Dict[str, str]]):
+        self._data = value
 
     def load(self):
-        if os.path.exists(self.filepath):
-            try:
-                with open(self.filepath, 'r', encoding='utf-8') as f:
-                    self.data = json.load(f)
-            except json.JSONDecodeError:
-                self.data = {}
-        else:
-            self.data = {}
+        data: Dict[str, Dict[str, str]] = {}
+        self._data = data
+        self._lines_on_disk = 0
+        if not os.path.exists(self.filepath) or os.path.getsize(self.filepath) == 0:
+            return
+
+        loads = orjson.loads if orjson is not None else json.loads
+        with open(self.filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                if not line.strip():
+                    continue
+                self._lines_on_disk += 1
+                try:
+                    record = loads(line)
+                except ValueError:
+                    # e.g. a line cut short by an interrupted run (JSONDecodeError),
+                    # or bytes that are not UTF-8 (UnicodeDecodeError)
+                    continue
+                if not isinstance(record, dict):
+                    continue
+                # Records with a namespace are AI verdicts from older versions,
+                # now cached as regular entries; compact() drops them
+                if "sig" in record and "ns" not in record:
+                    data[record.pop("sig")] = record
+
+    def flush(self):
+        if not self._unsaved:
+            return
+        directory = os.path.dirname(self.filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.filepath, 'ab+') as f:
+            # Appends always land at the end; if an interrupted run left the last
+            # line unterminated, close it first so it doesn't swallow our first record
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.writelines((json.dumps(record) + "\n").encode('utf-8') for record in self._unsaved)
+        self._lines_on_disk += len(self._unsaved)
+        self._unsaved = []
 
-    def save(self):
-        with open(self.filepath, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=4)
+        if self._lines_on_disk > max(self.COMPACT_MIN_LINES, self.COMPACT_RATIO * len(self.data)):
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the file with exactly one line per live entry.
+        """
+        records = [self._record(sig, c) for sig, c in self.data.items()]
+        tmp_path = self.filepath + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        os.replace(tmp_path, self.filepath)
+        self._lines_on_disk = len(records)
+        self._unsaved = []
+
+    @staticmethod
+    def _record(signature: str, complexity: Dict[str, str]) -> Dict[str, str]:
+        record = {"sig": signature}
+        record.update(complexity)
+        return record
 
     def get_complexity(self, signature: str) -> Optional[Dict[str, str]]:
-        return self.data.get(signature)
+        # Hot path: skip the property unless the file still has to be loaded
+        data = self._data if self._data is not None else self.data
+        return data.get(signature)
 
     def add_complexity(self, signature: str, complexity: Dict[str, str]):
         self.data[signature] = complexity
-        self.save()
+        self._changes[signature] = complexity
+        self._unsaved.append(self._record(signature, complexity))
+
+    def take_changes(self) -> Dict[str, Dict[str, str]]:
+        """
+        Returns the entries added since the last call, so a worker process
+        can hand them to the process that owns the file (see merge).
+        """
+        changes, self._changes = self._changes, {}
+        return changes
+
+    def merge(self, changes: Dict[str, Dict[str, str]]):
+        for signature, complexity in changes.items():
+            self.add_complexity(signature, complexity)
+
+    # Signatures are cache keys, not security tokens: a 16-byte blake2b is plenty
+    DIGEST_SIZE = 16
+
+    # Fields holding user-chosen identifiers; they are renamed before hashing
+    # (assignment targets and accessed arrays/objects are nodes, named by Variable.name)
+    IDENTIFIER_FIELDS = ('variable', 'name', 'procedure_name')
+    # Names with a meaning of their own for the analysis (n is the input size)
+    RESERVED_NAMES = ('n',)
 
     @staticmethod
     def compute_signature(node_dict: Dict) -> str:
@@ -36,8 +143,97 @@ class KnowledgeBase:
         Computes a deterministic hash of the node structure.
         We serialize the dict to a sorted JSON string and hash it.
         """
-        # We need to be careful about what we include in the signature.
-        # Variable names might matter for dependency analysis, but for generic structure
-        # we might want to abstract them. For now, let's hash the exact structure.
-        serialized = json.dumps(node_dict, sort_keys=True)
-        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+        # Identifiers are renamed in DFS order (v0, v1, ...), so loops that only
+        # differ in variable names share the same signature.
+        canonical = KnowledgeBase.canonicalize(node_dict, {})
+        if orjson is not None:
+            serialized = orjson.dumps(canonical, option=orjson.OPT_SORT_KEYS)
+        else:
+            # Same bytes orjson produces: compact separators, UTF-8, no escaping
+            serialized = json.dumps(canonical, sort_keys=True, separators=(',', ':'),
+                                    ensure_ascii=False).encode('utf-8')
+        return hashlib.blake2b(serialized, digest_size=KnowledgeBase.DIGEST_SIZE).hexdigest()
+
+    @staticmethod
+    def compute_node_signature(node: ASTNode) -> str:
+        """
+        Computes the signature straight from the AST, composing the cached
+        digests of the children instead of serializing the whole subtree.
+        """
+        return KnowledgeBase._node_digest(node)[0].hex()
+
+    @staticmethod
+    def _node_digest(node: ASTNode) -> Tuple[bytes, Tuple[str, ...]]:
+        if node._struct_hash is not None:
+            return node._struct_hash, node._struct_names
+
+        # Identifiers are hashed as their index of first use inside this subtree.
+        # Each child contributes its digest plus how its own indices map onto ours,
+        # which keeps the v0, v1, ... renaming of compute_signature.
+        names: List[str] = []
+        index: Dict[str, int] = {}
+
+        def local(name: str) -> int:
+            if name not in index:
+                index[name] = len(names)
+                names.append(name)
+            return index[name]
+
+        h = hashlib.blake2b(type(node).__name__.encode('utf-8'), digest_size=KnowledgeBase.DIGEST_SIZE)
+
+        def update_child(child: ASTNode):
+            digest, child_names = KnowledgeBase._node_digest(child)
+            h.update(digest)
+            h.update(repr(tuple(local(name) for name in child_names)).encode('utf-8'))
+
+        for f in KnowledgeBase._fields_of(type(node)):
+            value = getattr(node, f)
+            h.update(b'\0' + f.encode('utf-8') + b'=')
+            if isinstance(value, ASTNode):
+                update_child(value)
+            elif isinstance(value, list):
+                h.update(b'[')
+                for item in value:
+                    if isinstance(item, ASTNode):
+                        update_child(item)
+                    else:
+                        h.update(repr(item).encode('utf-8') + b',')
+                h.update(b']')
+            elif (f in KnowledgeBase.IDENTIFIER_FIELDS and isinstance(value, str)
+                    and value not in KnowledgeBase.RESERVED_NAMES):
+                h.update(b'#%d' % local(value))
+            else:
+                h.update(repr(value).encode('utf-8'))
+
+        node._struct_hash = h.digest()
+        node._struct_names = tuple(names)
+        return node._struct_hash, node._struct_names
+
+    _FIELDS_CACHE: Dict[type, Tuple[str, ...]] = {}
+
+    @staticmethod
+    def _fields_of(cls: type) -> Tuple[str, ...]:
+        names = KnowledgeBase._FIELDS_CACHE.get(cls)
+        if names is None:
+            names = tuple(f.name for f in dataclasses.fields(cls))
+            KnowledgeBase._FIELDS_CACHE[cls] = names
+        return names
+
+    @staticmethod
+    def canonicalize(value: Any, names: Dict[str, str]) -> Any:
+        if isinstance(value, list):
+            return [KnowledgeBase.canonicalize(item, names) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        result = {}
+        # Keys are visited in sorted order so the renaming matches the serialization
+        for k in sorted(value):
+            v = value[k]
+            if k in KnowledgeBase.IDENTIFIER_FIELDS and isinstance(v, str):
+                if v not in KnowledgeBase.RESERVED_NAMES:
+                    v = names.setdefault(v, f"v{len(names)}")
+                result[k] = v
+            else:
+                result[k] = KnowledgeBase.canonicalize(v, names)
+        return result
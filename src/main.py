@@ -1,53 +1,84 @@
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
 from .parser import Tokenizer, Parser
-from .analyzer import Analyzer
+from .analyzer import Analyzer, Complexity
 from .knowledge_base import KnowledgeBase
 
-def analyze_file(filepath: str, analyzer: Analyzer):
-    print(f"Analyzing {filepath}...")
+KB_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'knowledge_base.jsonl')
+
+def analyze_file(filepath: str, analyzer: Analyzer) -> Tuple[str, Complexity]:
+    with open(filepath, 'r', encoding='utf-8') as f:
+        code = f.read()
+
+    # The parser pulls tokens from the tokenizer as it goes
+    tokenizer = Tokenizer(code)
+    parser = Parser(tokenizer)
+    program = parser.parse_program()
+
+    complexity = analyzer.analyze(program)
+    return filepath, complexity
+
+# Per-process analyzer, created by _init_worker (nothing of it is ever pickled)
+_worker_analyzer: Optional[Analyzer] = None
+
+def _init_worker(kb_path: str):
+    global _worker_analyzer
+    # Each worker reads the knowledge base but never writes it: new entries
+    # go back to the main process, which saves the file once.
+    # The AI engine is only created if a file actually has a dependent loop.
+    # Workers don't see each other's new verdicts, so a dependent loop shared
+    # by files on different workers is sent to the AI once per worker
+    kb = KnowledgeBase(kb_path)
+    _worker_analyzer = Analyzer(kb)
+
+def analyze_file_worker(filepath: str) -> Tuple[str, Optional[Dict[str, str]], Optional[str], Dict[str, Any]]:
+    """
+    Returns (filepath, complexity, error, knowledge base changes). The
+    complexity travels as a dict to keep the result trivially picklable.
+    """
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            code = f.read()
-        
-        tokenizer = Tokenizer(code)
-        tokens = tokenizer.tokenize()
-        
-        parser = Parser(tokens)
-        program = parser.parse_program()
-        
-        complexity = analyzer.analyze(program)
-        
-        print(f"  Complexity: {complexity}")
-        print("-" * 20)
-        
+        _, complexity = analyze_file(filepath, _worker_analyzer)
+        result, error = complexity.to_dict(), None
     except Exception as e:
-        print(f"  Error: {e}")
-        print("-" * 20)
+        result, error = None, str(e)
+    return filepath, result, error, _worker_analyzer.kb.take_changes()
 
 def main():
     # Initialize Knowledge Base
-    kb_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'knowledge_base.json')
-    kb = KnowledgeBase(kb_path)
-    
-    analyzer = Analyzer(kb)
-    
+    kb = KnowledgeBase(KB_PATH)
+
     # Algorithms directory
     algo_dir = os.path.join(os.path.dirname(__file__), '..', 'algorithms')
-    
+
     if not os.path.exists(algo_dir):
         print(f"Directory {algo_dir} not found.")
         return
 
     files = [f for f in os.listdir(algo_dir) if f.endswith('.txt') or f.endswith('.psc')]
-    
+
     if not files:
         print("No algorithm files found in algorithms/ directory.")
         return
-        
-    for filename in files:
-        filepath = os.path.join(algo_dir, filename)
-        analyze_file(filepath, analyzer)
+
+    filepaths = [os.path.join(algo_dir, filename) for filename in files]
+    workers = min(len(filepaths), os.cpu_count() or 1)
+
+    try:
+        # Files are independent, analyze them in parallel (results keep the file order)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(KB_PATH,)) as pool:
+            for filepath, result, error, changes in pool.map(analyze_file_worker, filepaths):
+                print(f"Analyzing {filepath}...")
+                if error is None:
+                    print(f"  Complexity: {Complexity.from_dict(result)}")
+                else:
+                    print(f"  Error: {error}")
+                print("-" * 20)
+                kb.merge(changes)
+    finally:
+        # Write the knowledge base back once, after the whole run
+        kb.flush()
 
 if __name__ == "__main__":
     main()
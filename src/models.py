@@ -1,12 +1,54 @@
-from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any
+from dataclasses import dataclass, field, fields
+from typing import List, Optional, Dict, Any, FrozenSet, Union, get_type_hints
+import typing
 
+# Every node class, in definition order (filled in by _slotted)
+_NODE_CLASSES: List[type] = []
+
+def _slotted(cls: type) -> type:
+    """
+    Rebuilds a dataclass with __slots__ for the fields it declares plus its
+    _memo_slots, like dataclass(slots=True) does from Python 3.10 on. Nodes
+    are created by the thousand, so none of them carries a per-instance
+    __dict__; for that every class of the hierarchy is slotted.
+    """
+    own = cls.__dict__.get('__annotations__', {})
+    names = tuple(f.name for f in fields(cls) if f.name in own)
+    cls_dict = dict(cls.__dict__)
+    # Defaults live on as __init__ defaults, a class attribute would shadow the slot
+    for name in names + ('__dict__', '__weakref__'):
+        cls_dict.pop(name, None)
+    cls_dict['__slots__'] = names + cls_dict.pop('_memo_slots', ())
+    new_cls = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    _NODE_CLASSES.append(new_cls)
+    return new_cls
+
+@_slotted
 @dataclass
 class ASTNode:
+    # Per-instance memo slots filled in by the Analyzer. They are not dataclass
+    # fields, so they stay out of __init__, repr, equality and serialization.
+    _memo_slots = (
+        '_memo_sig',         # Optional[str]: knowledge base signature of this subtree
+        '_struct_hash',      # Optional[bytes]: structural digest, reused by parent nodes
+        '_struct_names',     # Optional[Tuple[str, ...]]: identifiers in DFS order of first use
+        # Single-entry memo: the last analysis result and the context key it was computed for.
+        # A different key simply overwrites the slot.
+        '_inline_ctx',       # Optional[frozenset]: context['loop_vars'] of the cached result
+        '_inline_res',       # Optional[Complexity]: result of analyzing this node
+    )
+
+    def __post_init__(self):
+        self._memo_sig = self._struct_hash = self._struct_names = None
+        self._inline_ctx = self._inline_res = None
+
     def to_dict(self) -> Dict[str, Any]:
+        # Generic version, the node classes below get a specialized one (see _compile_to_dict)
         result = {}
-        for k, v in self.__dict__.items():
-            if v is None:
+        for f in fields(self):
+            k = f.name
+            v = getattr(self, k)
+            if v is None or k.startswith('_'):
                 continue
             if isinstance(v, ASTNode):
                 result[k] = v.to_dict()
@@ -16,6 +58,7 @@ class ASTNode:
                 result[k] = v
         return result
 
+@_slotted
 @dataclass
 class Program(ASTNode):
     name: str
@@ -23,41 +66,49 @@ class Program(ASTNode):
     procedures: List['ProcedureDef'] = field(default_factory=list)
     main_block: 'Block' = field(default_factory=lambda: Block([]))
 
+@_slotted
 @dataclass
 class ClassDef(ASTNode):
     name: str
     attributes: List[str]
 
+@_slotted
 @dataclass
 class ProcedureDef(ASTNode):
     name: str
     params: List['Parameter']
     body: 'Block'
 
+@_slotted
 @dataclass
 class Parameter(ASTNode):
     name: str
     type_info: str  # e.g., "Integer", "Array", "Object"
 
+@_slotted
 @dataclass
 class Block(ASTNode):
     statements: List['Statement'] = field(default_factory=list)
 
+@_slotted
 @dataclass
 class Statement(ASTNode):
     pass
 
+@_slotted
 @dataclass
 class Assignment(Statement):
-    target: str
+    target: 'Expression' # Variable, ArrayAccess or FieldAccess
     value: 'Expression'
 
+@_slotted
 @dataclass
 class IfStatement(Statement):
     condition: 'Expression'
     then_block: Block
     else_block: Optional[Block] = None
 
+@_slotted
 @dataclass
 class ForLoop(Statement):
     variable: str
@@ -65,51 +116,144 @@ class ForLoop(Statement):
     end_value: 'Expression'
     body: Block
 
+@_slotted
 @dataclass
 class WhileLoop(Statement):
     condition: 'Expression'
     body: Block
 
+@_slotted
 @dataclass
 class RepeatLoop(Statement):
     condition: 'Expression'
     body: Block
 
+@_slotted
 @dataclass
 class Call(Statement):
     procedure_name: str
     arguments: List['Expression']
 
+@_slotted
 @dataclass
 class Expression(ASTNode):
-    pass
+    _memo_slots = ('_free_vars',) # Optional[FrozenSet[str]]: cached by free_vars()
+
+    def __post_init__(self):
+        ASTNode.__post_init__(self)
+        self._free_vars = None
 
+@_slotted
 @dataclass
 class BinaryOp(Expression):
     left: Expression
     operator: str
     right: Expression
 
+@_slotted
 @dataclass
 class UnaryOp(Expression):
     operator: str
     operand: Expression
 
+@_slotted
 @dataclass
 class Literal(Expression):
     value: Any
     type_name: str # "Integer", "Boolean", "String", "Null"
 
+@_slotted
 @dataclass
 class Variable(Expression):
     name: str
 
+@_slotted
 @dataclass
 class ArrayAccess(Expression):
-    array_name: str
+    array: Expression
     index: Expression
 
+@_slotted
 @dataclass
 class FieldAccess(Expression):
-    object_name: str
+    object: Expression
     field_name: str
+
+def free_vars(expr: Optional[Expression]) -> FrozenSet[str]:
+    """
+    Returns the names of the variables used by an expression.
+    Computed once per node and cached on it.
+    """
+    if expr is None:
+        return frozenset()
+    if expr._free_vars is None:
+        if isinstance(expr, Variable):
+            result = frozenset((expr.name,))
+        elif isinstance(expr, BinaryOp):
+            result = free_vars(expr.left) | free_vars(expr.right)
+        elif isinstance(expr, UnaryOp):
+            result = free_vars(expr.operand)
+        elif isinstance(expr, ArrayAccess):
+            result = free_vars(expr.array) | free_vars(expr.index)
+        elif isinstance(expr, FieldAccess):
+            result = free_vars(expr.object)
+        else:
+            result = frozenset()
+        expr._free_vars = result
+    return expr._free_vars
+
+
+def _field_kind(hint: Any) -> str:
+    # "node" for (optional) AST nodes, "nodes" for lists of them, "list" for
+    # other lists, "scalar" for plain str/int/... and "value" for anything else
+    origin = typing.get_origin(hint)
+    args = typing.get_args(hint)
+    if origin is Union:
+        args = [a for a in args if a is not type(None)]
+        return _field_kind(args[0]) if len(args) == 1 else "value"
+    if origin in (list, List):
+        if args and isinstance(args[0], type) and issubclass(args[0], ASTNode):
+            return "nodes"
+        return "list"
+    if isinstance(hint, type) and issubclass(hint, ASTNode):
+        return "node"
+    if hint in (str, int, float, bool):
+        return "scalar"
+    return "value"
+
+def _compile_to_dict(cls: type):
+    """
+    Generates a to_dict for cls with one straight-line statement per field,
+    equivalent to the generic ASTNode.to_dict but with no __dict__ iteration
+    nor isinstance checks.
+    """
+    hints = get_type_hints(cls)
+    lines = ["def to_dict(self):", "    result = {}"]
+    for f in fields(cls):
+        kind = _field_kind(hints.get(f.name, Any))
+        if kind == "nodes":
+            lines.append(f"    result[{f.name!r}] = [item.to_dict() for item in self.{f.name}]")
+            continue
+        lines.append(f"    v = self.{f.name}")
+        lines.append("    if v is not None:")
+        if kind == "node":
+            lines.append(f"        result[{f.name!r}] = v.to_dict()")
+        elif kind == "scalar":
+            lines.append(f"        result[{f.name!r}] = v")
+        elif kind == "list":
+            lines.append(f"        result[{f.name!r}] = [item.to_dict() if isinstance(item, ASTNode) else item for item in v]")
+        else:
+            # Fields typed as Any may still hold a node at runtime
+            lines.append(f"        result[{f.name!r}] = v.to_dict() if isinstance(v, ASTNode) else v")
+    lines.append("    return result")
+
+    namespace: Dict[str, Any] = {}
+    exec("\n".join(lines), {"ASTNode": ASTNode}, namespace)
+    to_dict = namespace["to_dict"]
+    to_dict.__qualname__ = f"{cls.__name__}.to_dict"
+    return to_dict
+
+# All forward references are resolvable now, specialize every node class
+for _cls in _NODE_CLASSES:
+    if _cls is not ASTNode:
+        _cls.to_dict = _compile_to_dict(_cls)
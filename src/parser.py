@@ -1,8 +1,13 @@
-import re
-from typing import List, Optional, Any
+import sys
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterable, Iterator, List, Optional, Any
 from .models import *
 
 class Token:
+    # One per lexeme, so no per-instance __dict__
+    __slots__ = ('type', 'value', 'line', 'column')
+
     def __init__(self, type_: str, value: str, line: int, column: int):
         self.type = type_
         self.value = value
@@ -12,39 +17,152 @@ class Token:
     def __repr__(self):
         return f"Token({self.type}, {self.value}, {self.line}:{self.column})"
 
-class Tokenizer:
-    TOKEN_TYPES = [
-        ('COMMENT', r'►.*'),
-        ('STRING', r'"[^"]*"'),
-        ('NUMBER', r'\d+(\.\d+)?'),
-        ('ASSIGN', r'🡨|<-'), # Support both arrow char and text representation
-        ('LE', r'≤|<='),
-        ('GE', r'≥|>='),
-        ('NE', r'≠|<>'),
-        ('EQ', r'='),
-        ('LT', r'<'),
-        ('GT', r'>'),
-        ('LPAREN', r'\('),
-        ('RPAREN', r'\)'),
-        ('LBRACKET', r'\['),
-        ('RBRACKET', r'\]'),
-        ('DOTDOT', r'\.\.'),
-        ('DOT', r'\.'),
-        ('COMMA', r','),
-        ('PLUS', r'\+'),
-        ('MINUS', r'-'),
-        ('MULTIPLY', r'\*'),
-        ('DIVIDE', r'/'),
-        ('MOD', r'mod'),
-        ('DIV', r'div'),
-        ('CEIL', r'┌|ceil'),
-        ('FLOOR', r'└|floor'), # Assuming these might be used as operators or functions
-        ('ID', r'[a-zA-Z_][a-zA-Z0-9_]*'),
-        ('NEWLINE', r'\n'),
-        ('SKIP', r'[ \t]+'),
-        ('MISMATCH', r'.'),
-    ]
+# Scanners for the tokens longer than one character. Each one gets the source
+# as UTF-8 bytes and the offset where the token starts, and returns
+# (token_type, end_offset).
+
+_DIGITS = frozenset(b'0123456789')
+_ID_CHARS = frozenset(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+_BLANKS = frozenset(b' \t\n')
+_DOT = ord('.')
+_COMMENT = '►'.encode('utf-8')
+_COMMENT_LEAD = _COMMENT[0]
+
+# Reserved words, matched case-insensitively: the operator words and the
+# keywords of the grammar, each with its own token type
+_KEYWORDS = {sys.intern(k): sys.intern(v) for k, v in {
+    'mod': 'MOD', 'div': 'DIV', 'ceil': 'CEIL', 'floor': 'FLOOR',
+    'if': 'KW_IF', 'then': 'KW_THEN', 'else': 'KW_ELSE',
+    'for': 'KW_FOR', 'to': 'KW_TO', 'do': 'KW_DO',
+    'while': 'KW_WHILE', 'repeat': 'KW_REPEAT', 'until': 'KW_UNTIL',
+    'begin': 'KW_BEGIN', 'end': 'KW_END', 'call': 'KW_CALL',
+    'clase': 'KW_CLASE', 'length': 'KW_LENGTH',
+}.items()}
+
+def _scan_number(code: bytes, pos: int):
+    n = len(code)
+    end = pos + 1
+    while end < n and code[end] in _DIGITS:
+        end += 1
+    # Decimal part, but not the '..' of a range
+    if end + 1 < n and code[end] == _DOT and code[end + 1] in _DIGITS:
+        end += 2
+        while end < n and code[end] in _DIGITS:
+            end += 1
+    return 'NUMBER', end
+
+def _scan_id(code: bytes, pos: int):
+    n = len(code)
+    end = pos + 1
+    while end < n and code[end] in _ID_CHARS:
+        end += 1
+    # Reserved words are told apart by the tokenizer, which lowercases IDs anyway
+    return 'ID', end
+
+def _scan_string(code: bytes, pos: int):
+    end = code.find(b'"', pos + 1)
+    if end < 0:
+        return 'MISMATCH', pos + 1
+    return 'STRING', end + 1
+
+def _scan_comment(code: bytes, pos: int):
+    # ► up to the end of the line, then on through the blanks that follow
+    end = code.find(b'\n', pos)
+    if end < 0:
+        return 'SKIP', len(code)
+    return _scan_blank(code, end)
+
+def _scan_blank(code: bytes, pos: int):
+    # Blanks, newlines and the comments between them are skipped in one go
+    n = len(code)
+    end = pos + 1
+    while end < n:
+        if code[end] in _BLANKS:
+            end += 1
+        elif code[end] == _COMMENT_LEAD and code.startswith(_COMMENT, end):
+            end = code.find(b'\n', end)
+            if end < 0:
+                return 'SKIP', n
+        else:
+            break
+    return 'SKIP', end
+
+def _scan_lt(code: bytes, pos: int):
+    nxt = code[pos + 1:pos + 2]
+    if nxt == b'-': return 'ASSIGN', pos + 2
+    if nxt == b'=': return 'LE', pos + 2
+    if nxt == b'>': return 'NE', pos + 2
+    return 'LT', pos + 1
+
+def _scan_gt(code: bytes, pos: int):
+    if code[pos + 1:pos + 2] == b'=': return 'GE', pos + 2
+    return 'GT', pos + 1
 
+def _scan_dot(code: bytes, pos: int):
+    if code[pos + 1:pos + 2] == b'.': return 'DOTDOT', pos + 2
+    return 'DOT', pos + 1
+
+# The pseudocode symbols outside ASCII, by their UTF-8 encoding
+_UNICODE_OPS = {
+    _COMMENT: _scan_comment,
+    '🡨'.encode('utf-8'): 'ASSIGN', # Same as <-
+    '≤'.encode('utf-8'): 'LE',
+    '≥'.encode('utf-8'): 'GE',
+    '≠'.encode('utf-8'): 'NE',
+    '┌'.encode('utf-8'): 'CEIL',
+    '└'.encode('utf-8'): 'FLOOR',
+}
+
+def _scan_unicode(code: bytes, pos: int):
+    # The lead byte gives the length of the UTF-8 sequence
+    lead = code[pos]
+    size = 2 if lead < 0xE0 else 3 if lead < 0xF0 else 4
+    entry = _UNICODE_OPS.get(code[pos:pos + size])
+    if entry is None:
+        return 'MISMATCH', pos + size
+    if type(entry) is str:
+        return entry, pos + size
+    return entry(code, pos)
+
+def _build_dispatch():
+    # Indexed by a byte of the UTF-8 source: either the type of a
+    # single-character token or the scanner for longer ones
+    table: List[Any] = [None] * 256
+    for ch in '0123456789':
+        table[ord(ch)] = _scan_number
+    for ch in 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_':
+        table[ord(ch)] = _scan_id
+    for ch, token_type in (('(', 'LPAREN'), (')', 'RPAREN'), ('[', 'LBRACKET'), (']', 'RBRACKET'),
+                           ('{', 'LBRACE'), ('}', 'RBRACE'), (',', 'COMMA'), ('+', 'PLUS'), ('-', 'MINUS'), ('*', 'MULTIPLY'),
+                           ('/', 'DIVIDE'), ('=', 'EQ')):
+        table[ord(ch)] = token_type
+    table[ord('"')] = _scan_string
+    table[ord(' ')] = _scan_blank
+    table[ord('\t')] = _scan_blank
+    table[ord('\n')] = _scan_blank # Lines are tracked apart, see Tokenizer.tokenize
+    table[ord('<')] = _scan_lt
+    table[ord('>')] = _scan_gt
+    table[ord('.')] = _scan_dot
+    # Every non-ASCII character starts with a byte >= 0x80
+    for b in range(0x80, 0x100):
+        table[b] = _scan_unicode
+    # Token types are compared all over the parser, make them identity-comparable
+    return [sys.intern(entry) if type(entry) is str else entry for entry in table]
+
+_DISPATCH = _build_dispatch()
+
+def _line_starts(code: bytes) -> List[int]:
+    # Offset of the first byte of each line: line k (1-based) starts at [k - 1].
+    # Built from the line lengths so that both the newline search (split)
+    # and the running sum (accumulate) run in C
+    starts = list(accumulate(map((1).__add__, map(len, code.split(b'\n'))), initial=0))
+    starts.pop() # One past the end of the last line
+    return starts
+
+# Values of the single-character tokens, so they are not decoded each time
+_CHARS = [chr(b) for b in range(128)]
+
+class Tokenizer:
     def __init__(self, code: str):
         self.code = code
         self.tokens: List[Token] = []
@@ -52,78 +170,149 @@ class Tokenizer:
         self.line = 1
         self.column = 1
 
-    def tokenize(self):
-        tokens = []
-        while self.pos < len(self.code):
-            match = None
-            for token_type, pattern in self.TOKEN_TYPES:
-                # Use word boundary for keywords/operators that are words
-                if token_type in ['MOD', 'DIV']:
-                    regex = re.compile(pattern + r'(?![a-zA-Z0-9_])', re.IGNORECASE)
+    def tokenize(self) -> List[Token]:
+        self.tokens = list(self)
+        return self.tokens
+
+    def __iter__(self) -> Iterator[Token]:
+        # Tokens are produced as they are scanned, so the parser can consume
+        # them without the whole list ever existing (see LookaheadStream).
+        # Scanned as UTF-8: the source is indexed by byte, and most of it is ASCII.
+        # Offsets are in bytes, so columns subtract the extra bytes that the
+        # multi-byte characters before the token took up on its line
+        code = self.code.encode('utf-8')
+        n = len(code)
+        pos = 0
+        # Newlines are skipped like blanks; the line of a token is looked up in
+        # the line index, and only once the scan has moved past the current line
+        line_starts = _line_starts(code)
+        line = 1
+        line_start = 0 # Offset of the first byte of the current line
+        next_line_start = line_starts[1] if len(line_starts) > 1 else n + 1
+        line_extra = 0 # Bytes beyond one per character so far on the current line
+        words = {} # Raw ID bytes -> (token_type, value)
+        while pos < n:
+            entry = _DISPATCH[code[pos]]
+            if entry is None:
+                self.line = bisect_right(line_starts, pos)
+                raise SyntaxError(f'Unexpected character {_CHARS[code[pos]]!r} on line {self.line}')
+            if type(entry) is str:
+                token_type, end = entry, pos + 1
+            else:
+                token_type, end = entry(code, pos)
+
+            if token_type == 'SKIP':
+                pos = end
+                continue
+            if pos >= next_line_start:
+                line = bisect_right(line_starts, pos)
+                line_start = line_starts[line - 1]
+                next_line_start = line_starts[line] if line < len(line_starts) else n + 1
+                line_extra = 0
+            if token_type == 'MISMATCH':
+                self.line = line
+                ch = code[pos:pos + 4].decode('utf-8', 'ignore')[:1]
+                raise SyntaxError(f'Unexpected character {ch!r} on line {line}')
+
+            column = pos - line_start - line_extra + 1
+            if token_type == 'ID':
+                # Names repeat a lot: decode, lowercase and classify each one once
+                raw = code[pos:end]
+                word = words.get(raw)
+                if word is None:
+                    value = raw.decode('ascii')
+                    word = words[raw] = (_KEYWORDS.get(value.lower(), 'ID'), value)
+                token_type, value = word
+                yield Token(token_type, value, line, column)
+            elif end == pos + 1:
+                yield Token(token_type, _CHARS[code[pos]], line, column)
+            else:
+                value = code[pos:end].decode('utf-8')
+                yield Token(token_type, value, line, column)
+                if token_type == 'STRING' and '\n' in value:
+                    # Strings may span lines: continue on the line where this one ends
+                    line = bisect_right(line_starts, end - 1)
+                    line_start = line_starts[line - 1]
+                    next_line_start = line_starts[line] if line < len(line_starts) else n + 1
+                    line_extra = end - line_start - (len(value) - value.rindex('\n') - 1)
                 else:
-                    regex = re.compile(pattern)
-                
-                match = regex.match(self.code, self.pos)
-                if match:
-                    value = match.group(0)
-                    if token_type == 'NEWLINE':
-                        self.line += 1
-                        self.column = 1
-                    elif token_type == 'SKIP':
-                        self.column += len(value)
-                    elif token_type == 'COMMENT':
-                        # Ignore comments
-                        pass
-                    elif token_type == 'MISMATCH':
-                        raise SyntaxError(f'Unexpected character {value!r} on line {self.line}')
-                    else:
-                        tokens.append(Token(token_type, value, self.line, self.column))
-                        self.column += len(value)
-                    
-                    self.pos = match.end()
-                    break
-            if not match:
-                 raise SyntaxError(f'Unexpected character on line {self.line}')
-        
-        self.tokens = tokens
-        return tokens
+                    line_extra += end - pos - len(value)
+            pos = end
+
+        self.line = len(line_starts)
+        self.pos = len(self.code)
+
+class LookaheadStream:
+    """
+    Hands out the tokens of an iterable one at a time, keeping only the ones
+    peeked at but not consumed yet (the parser looks at most two ahead).
+    Past the end, peek returns None.
+    """
+    __slots__ = ('_it', '_buf')
+
+    def __init__(self, tokens: Iterable[Token]):
+        self._it = iter(tokens)
+        self._buf: List[Optional[Token]] = []
+
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        buf = self._buf
+        while len(buf) <= offset:
+            buf.append(next(self._it, None))
+        return buf[offset]
+
+    def consume(self) -> Optional[Token]:
+        buf = self._buf
+        return buf.pop(0) if buf else next(self._it, None)
+
+# Binary operator token type -> precedence (higher binds tighter)
+_PREC = {
+    'LT': 1, 'GT': 1, 'LE': 1, 'GE': 1, 'EQ': 1, 'NE': 1,
+    'PLUS': 2, 'MINUS': 2,
+    'MULTIPLY': 3, 'DIVIDE': 3, 'MOD': 3, 'DIV': 3,
+}
+
+# Token types that close a block body
+_BLOCK_TERMINATORS = frozenset(('KW_END', 'KW_UNTIL', 'KW_ELSE'))
 
 class Parser:
-    def __init__(self, tokens: List[Token]):
-        self.tokens = tokens
-        self.pos = 0
+    def __init__(self, tokens: Iterable[Token]):
+        # A token list or a Tokenizer, which is then read lazily
+        self.tokens = LookaheadStream(tokens)
 
     def peek(self, offset=0) -> Optional[Token]:
-        if self.pos + offset < len(self.tokens):
-            return self.tokens[self.pos + offset]
-        return None
+        return self.tokens.peek(offset)
 
     def consume(self, type_: str = None) -> Token:
-        token = self.peek()
+        tokens = self.tokens
+        token = tokens.peek()
         if token is None:
              raise SyntaxError("Unexpected end of input")
         if type_ and token.type != type_:
             raise SyntaxError(f"Expected {type_}, got {token.type} ('{token.value}') at line {token.line}")
-        self.pos += 1
+        tokens.consume()
         return token
 
     def match(self, type_: str) -> bool:
-        token = self.peek()
-        if token and token.type == type_:
-            self.consume()
+        tokens = self.tokens
+        token = tokens.peek()
+        if token is not None and token.type == type_:
+            tokens.consume()
             return True
         return False
 
     def parse_program(self) -> Program:
+        peek = self.tokens.peek
         classes = []
         procedures = []
         
-        # Parse Classes
-        while self.peek() and self.peek().value.lower() == 'clase':
+        # Parse Classes: "Casa {Area color propietario}", optionally after 'Clase'
+        while peek() is not None and (peek().type == 'KW_CLASE' or
+                                      (peek().type == 'ID' and peek(1) is not None and peek(1).type == 'LBRACE')):
             classes.append(self.parse_class_def())
         
         # Parse Procedures
-        while self.peek() and self.peek().type == 'ID' and self.peek(1) and self.peek(1).type == 'LPAREN':
+        while (peek() is not None and peek().type == 'ID'
+               and peek(1) is not None and peek(1).type == 'LPAREN'):
              # Heuristic to distinguish procedure definition from main block or other things
              # Actually, the grammar says "nombre_subrutina(params) begin ... end"
              # But main block is just "begin ... end" or statements?
@@ -135,22 +324,19 @@ class Parser:
         # Parse Main Block (optional or implicit?)
         # If we see 'begin', it's the main block.
         main_block = Block([])
-        if self.peek() and self.peek().value.lower() == 'begin':
-            self.consume() # begin
+        if self.match('KW_BEGIN'):
             main_block = self.parse_block_body() # parses until 'end'
-            self.consume('ID') # consume 'end' (the tokenizer types 'end' as ID) - wait, 'end' is ID.
-            # We need to verify if 'end' is reserved. In my tokenizer ID matches keywords.
-            # I should handle keywords better.
+            self.consume('KW_END')
         
         return Program("Program", classes, procedures, main_block)
 
     def parse_class_def(self) -> ClassDef:
-        self.consume('ID') # Clase
+        self.match('KW_CLASE')
         name = self.consume('ID').value
-        self.consume('LBRACE') # We need LBRACE in tokenizer!
-        # Wait, grammar says "llaves".
+        # Attributes are listed between braces, separated by blanks
+        self.consume('LBRACE')
         attributes = []
-        while self.peek() and self.peek().type != 'RBRACE': # Need RBRACE
+        while self.peek() and self.peek().type != 'RBRACE':
              attributes.append(self.consume('ID').value)
         self.consume('RBRACE')
         return ClassDef(name, attributes)
@@ -164,7 +350,7 @@ class Parser:
                 # Parameter parsing is tricky: "param1" or "arr[n]..[m]" or "Clase obj"
                 # Simplified for now:
                 type_info = "Unknown"
-                if self.peek().value.lower() == 'clase':
+                if self.peek().type == 'KW_CLASE':
                     self.consume()
                     type_info = self.consume('ID').value # Class Name
                     param_name = self.consume('ID').value # Object Name? Grammar says "Clase nombre_objeto"
@@ -190,40 +376,32 @@ class Parser:
                     break
         self.consume('RPAREN')
         
-        self.consume_keyword('begin')
+        self.consume('KW_BEGIN')
         body = self.parse_block_body()
-        self.consume_keyword('end')
+        self.consume('KW_END')
         
         return ProcedureDef(name, params, body)
 
     def parse_block_body(self) -> Block:
+        peek = self.tokens.peek
         statements = []
         # Parse until 'end' or 'until' or 'else' (if nested)
         # We need to know when to stop.
         # Usually blocks are terminated by 'end', 'until', 'else'.
-        while self.peek():
-            token = self.peek()
-            val = token.value.lower()
-            if val in ['end', 'until', 'else']:
+        while True:
+            token = peek()
+            if token is None or token.type in _BLOCK_TERMINATORS:
                 break
             statements.append(self.parse_statement())
         return Block(statements)
 
     def parse_statement(self) -> Statement:
         token = self.peek()
-        val = token.value.lower()
-
-        if val == 'if':
-            return self.parse_if()
-        elif val == 'for':
-            return self.parse_for()
-        elif val == 'while':
-            return self.parse_while()
-        elif val == 'repeat':
-            return self.parse_repeat()
-        elif val == 'call':
-            return self.parse_call()
-        elif token.type == 'ID':
+        token_type = token.type
+        parse = _STATEMENT_PARSERS.get(token_type)
+        if parse is not None:
+            return parse(self)
+        elif token_type == 'ID':
             # Assignment or Procedure Call (if implicit without CALL, but grammar says CALL is used)
             # Grammar: "La asignación se indica mediante el símbolo 🡨"
             # So ID <- Expr
@@ -237,76 +415,70 @@ class Parser:
         target_expr = self.parse_expression() # We parse as expression to handle fields/arrays
         # Verify target_expr is a valid lvalue (Variable, FieldAccess, ArrayAccess)
         # For now assume it is.
-        # We need to convert Expression back to string representation or keep as Node?
-        # Model says target: str. Let's keep it simple for now, maybe just ID.
-        # But grammar allows x.f <- y.
-        # Let's change Assignment model to take Expression as target or handle it.
-        # For now, let's assume target is just the string representation.
         
         if not self.match('ASSIGN'):
              raise SyntaxError(f"Expected assignment operator at line {self.peek().line}")
         
         value = self.parse_expression()
-        return Assignment(str(target_expr), value) # Simplified target
+        return Assignment(target_expr, value)
 
     def parse_if(self) -> IfStatement:
-        self.consume_keyword('if')
+        self.consume('KW_IF')
         self.consume('LPAREN')
         condition = self.parse_expression()
         self.consume('RPAREN')
-        self.consume_keyword('then')
+        self.consume('KW_THEN')
         
         # Grammar says: if (cond) then begin ... end else begin ... end
         # But also allows single statement? "begin ... end" is a block.
         # Let's assume it always uses begin/end as per grammar examples.
-        self.consume_keyword('begin')
+        self.consume('KW_BEGIN')
         then_block = self.parse_block_body()
-        self.consume_keyword('end')
+        self.consume('KW_END')
         
         else_block = None
-        if self.peek() and self.peek().value.lower() == 'else':
-            self.consume()
-            self.consume_keyword('begin')
+        if self.match('KW_ELSE'):
+            self.consume('KW_BEGIN')
             else_block = self.parse_block_body()
-            self.consume_keyword('end')
+            self.consume('KW_END')
             
         return IfStatement(condition, then_block, else_block)
 
     def parse_for(self) -> ForLoop:
-        self.consume_keyword('for')
+        self.consume('KW_FOR')
         variable = self.consume('ID').value
         self.consume('ASSIGN')
         start_val = self.parse_expression()
-        self.consume_keyword('to')
+        self.consume('KW_TO')
         end_val = self.parse_expression()
-        self.consume_keyword('do')
-        self.consume_keyword('begin')
+        self.consume('KW_DO')
+        self.consume('KW_BEGIN')
         body = self.parse_block_body()
-        self.consume_keyword('end')
+        self.consume('KW_END')
         return ForLoop(variable, start_val, end_val, body)
 
     def parse_while(self) -> WhileLoop:
-        self.consume_keyword('while')
+        self.consume('KW_WHILE')
         self.consume('LPAREN')
         condition = self.parse_expression()
         self.consume('RPAREN')
-        self.consume_keyword('do')
-        self.consume_keyword('begin')
+        self.consume('KW_DO')
+        self.consume('KW_BEGIN')
         body = self.parse_block_body()
-        self.consume_keyword('end')
+        self.consume('KW_END')
         return WhileLoop(condition, body)
 
     def parse_repeat(self) -> RepeatLoop:
-        self.consume_keyword('repeat')
+        self.consume('KW_REPEAT')
         body = self.parse_block_body()
-        self.consume_keyword('until')
+        self.consume('KW_UNTIL')
         self.consume('LPAREN')
         condition = self.parse_expression()
         self.consume('RPAREN')
         return RepeatLoop(condition, body)
 
     def parse_call(self) -> Call:
-        self.consume_keyword('call')
+        self.consume('KW_CALL')
         proc_name = self.consume('ID').value
         self.consume('LPAREN')
         args = []
@@ -318,66 +490,57 @@ class Parser:
         self.consume('RPAREN')
         return Call(proc_name, args)
 
-    def parse_expression(self) -> Expression:
-        # Simple recursive descent for expressions
-        # Priority: ( ) -> * / -> + - -> Relational
-        return self.parse_relational()
-
-    def parse_relational(self) -> Expression:
-        left = self.parse_term()
-        while self.peek() and self.peek().type in ['LT', 'GT', 'LE', 'GE', 'EQ', 'NE']:
-            op = self.consume().value
-            right = self.parse_term()
-            left = BinaryOp(left, op, right)
-        return left
-
-    def parse_term(self) -> Expression:
-        left = self.parse_factor()
-        while self.peek() and self.peek().type in ['PLUS', 'MINUS']:
-            op = self.consume().value
-            right = self.parse_factor()
-            left = BinaryOp(left, op, right)
-        return left
-
-    def parse_factor(self) -> Expression:
+    def parse_expression(self, min_prec: int = 1) -> Expression:
+        # Precedence climbing over _PREC: each operand is parsed by
+        # parse_primary and binds to the operators at or above min_prec
+        tokens = self.tokens
         left = self.parse_primary()
-        while self.peek() and self.peek().type in ['MULTIPLY', 'DIVIDE', 'MOD', 'DIV']:
-             op_token = self.consume()
-             right = self.parse_primary()
-             left = BinaryOp(left, op_token.value, right)
+        while True:
+            token = tokens.peek()
+            prec = _PREC.get(token.type, 0) if token is not None else 0
+            if prec < min_prec:
+                break
+            tokens.consume()
+            # Operators are left-associative: the right side only takes tighter ones
+            right = self.parse_expression(prec + 1)
+            left = BinaryOp(left, token.value, right)
         return left
 
     def parse_primary(self) -> Expression:
         token = self.peek()
-        if self.match('LPAREN'):
+        if token is None:
+            raise SyntaxError("Unexpected end of input")
+        token_type = token.type
+        if token_type == 'LPAREN':
+            self.tokens.consume()
             expr = self.parse_expression()
             self.consume('RPAREN')
             return expr
-        elif token.type == 'NUMBER':
-            self.consume()
+        elif token_type == 'NUMBER':
+            self.tokens.consume()
             return Literal(token.value, "Integer") # Simplified type
-        elif token.type == 'STRING':
-            self.consume()
+        elif token_type == 'STRING':
+            self.tokens.consume()
             return Literal(token.value, "String")
-        elif token.type == 'ID':
+        elif token_type == 'ID':
             # Could be Variable, ArrayAccess, FieldAccess, FunctionCall (length)
-            name = self.consume().value
-            expr = Variable(name)
+            self.tokens.consume()
+            expr = Variable(token.value)
             
             # Handle suffix: .field or [index]
             while True:
                 if self.match('DOT'):
                     field = self.consume('ID').value
-                    expr = FieldAccess(str(expr), field) # Simplified object name
+                    expr = FieldAccess(expr, field)
                 elif self.match('LBRACKET'):
                     index = self.parse_expression()
                     self.consume('RBRACKET')
-                    expr = ArrayAccess(str(expr), index)
+                    expr = ArrayAccess(expr, index)
                 else:
                     break
             return expr
-        elif token.value.lower() == 'length':
-             self.consume()
+        elif token_type == 'KW_LENGTH':
+             self.tokens.consume()
              self.consume('LPAREN')
              arg = self.parse_expression()
              self.consume('RPAREN')
@@ -385,10 +548,11 @@ class Parser:
         else:
             raise SyntaxError(f"Unexpected token in expression: {token}")
 
-    def consume_keyword(self, keyword: str):
-        token = self.peek()
-        if token and token.type == 'ID' and token.value.lower() == keyword.lower():
-            self.consume()
-        else:
-            raise SyntaxError(f"Expected keyword '{keyword}', got {token}")
-
+# Statement keyword token type -> parsing method
+_STATEMENT_PARSERS = {
+    'KW_IF': Parser.parse_if,
+    'KW_FOR': Parser.parse_for,
+    'KW_WHILE': Parser.parse_while,
+    'KW_REPEAT': Parser.parse_repeat,
+    'KW_CALL': Parser.parse_call,
+}